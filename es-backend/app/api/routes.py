@@ -5,8 +5,13 @@ import json
 import httpx
 import tiktoken
 import subprocess
+import heapq
+import asyncio
+import numpy as np
+import pandas as pd
 from datetime import datetime
-from typing import List, Dict
+from urllib.parse import urlsplit, parse_qs
+from typing import List, Dict, Any
 from dotenv import load_dotenv
 from fastapi import APIRouter, HTTPException, Query
 from app.core.models import QueryInput,ChatMessage,ts_init,ChatMessageTool
@@ -112,53 +117,171 @@ async def get_cluster_health(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def parse_cat_value(value):
-    try:
-        value = value.lower().strip()
-        if value.endswith("kb"):
-            return int(float(value[:-2]) * 1024)
-        elif value.endswith("mb"):
-            return int(float(value[:-2]) * 1024 ** 2)
-        elif value.endswith("gb"):
-            return int(float(value[:-2]) * 1024 ** 3)
-        elif value.endswith("b"):
-            return int(float(value[:-1]))
-        return int(value)
-    except:
-        return 0
+STATS_FIELDS = {
+    "docs_count": ("docs", "count"),
+    "store_size": ("store", "size_in_bytes"),
+    "indexing_index_total": ("indexing", "index_total"),
+    "refresh_refresh_total": ("refresh", "total"),
+    "search_query_total": ("search", "query_total"),
+}
+
+
+def build_stats_call(fields: List[str]) -> str:
+    metrics = sorted({STATS_FIELDS[field][0] for field in fields})
+    filter_path = [f"indices.*.primaries.{'.'.join(STATS_FIELDS[field])}" for field in fields]
+    filter_path.append("indices.*.health")
+    return f"_stats/{','.join(metrics)}?level=indices&filter_path={','.join(filter_path)}"
+
+
+class StatsIndicesParser:
+    """Incrementally parses a `_stats?level=indices` body, yielding one index at a time.
+
+    Only the entry currently being read is kept in the buffer, so memory stays flat
+    no matter how many indices the cluster has.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"
+        self.in_indices = False
+        self.eof = False
+        self.ready = []
+
+    def feed(self, text: str) -> List[tuple]:
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        while self._step():
+            pass
+        ready, self.ready = self.ready, []
+        return ready
+
+    def close(self) -> List[tuple]:
+        self.eof = True
+        ready = self.feed("")
+        if self.state != "done":
+            raise ValueError("Truncated _stats response")
+        return ready
+
+    def _skip(self, pos: int) -> int:
+        while pos < len(self.buffer) and self.buffer[pos] in " \t\r\n,":
+            pos += 1
+        return pos
+
+    def _decode(self, pos: int):
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, pos)
+        except json.JSONDecodeError:
+            return None
+        # a bare number at the end of the buffer may still be missing digits
+        if end >= len(self.buffer) and not self.eof:
+            return None
+        return value, end
+
+    def _step(self) -> bool:
+        pos = self._skip(self.pos)
+        if pos >= len(self.buffer) or self.state == "done":
+            return False
+        char = self.buffer[pos]
+        if self.state == "start":
+            if char != "{":
+                raise ValueError("Unexpected _stats response")
+            self.pos, self.state = pos + 1, "key"
+            return True
+        if char == "}":
+            self.pos = pos + 1
+            if self.in_indices:
+                self.in_indices = False
+            else:
+                self.state = "done"
+            return True
+
+        key = self._decode(pos)
+        if key is None:
+            return False
+        key, pos = key
+        pos = self._skip(pos)
+        if pos >= len(self.buffer):
+            return False
+        if self.buffer[pos] != ":":
+            raise ValueError("Unexpected _stats response")
+        pos = self._skip(pos + 1)
+        if pos >= len(self.buffer):
+            return False
+        if not self.in_indices and key == "indices" and self.buffer[pos] == "{":
+            self.pos, self.in_indices = pos + 1, True
+            return True
+
+        value = self._decode(pos)
+        if value is None:
+            return False
+        value, self.pos = value
+        if self.in_indices:
+            self.ready.append((key, value))
+        return True
+
+
+def project_index_stats(index_name: str, data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    primaries = data.get("primaries", {})
+    entry = {"index": index_name}
+    for field in fields:
+        group, stat = STATS_FIELDS[field]
+        entry[field] = primaries.get(group, {}).get(stat, 0)
+    entry["health"] = data.get("health", "unknown")
+    return entry
+
+
+async def stream_index_stats(response: httpx.Response, fields: List[str]):
+    parser = StatsIndicesParser()
+    async for chunk in response.aiter_text():
+        for index_name, data in parser.feed(chunk):
+            yield project_index_stats(index_name, data, fields)
+    for index_name, data in parser.close():
+        yield project_index_stats(index_name, data, fields)
+
 
 @router.get("/get-top-indices")
 async def get_top_indices(
     cluster_name: str=Query(default="", description="Name of the Elasticsearch cluster"),
     top_n: int = Query(default=5, gt=-1),
-    sort_by: str = Query(default="docs_count", enum=["docs_count", "store_size", "indexing_index_total", "refresh_refresh_total", "search_query_total"]),
+    sort_by: str = Query(default="docs_count", enum=list(STATS_FIELDS)),
+    fields: List[str] = Query(default=list(STATS_FIELDS), enum=list(STATS_FIELDS)),
 ):
+    unknown = [field for field in [sort_by, *fields] if field not in STATS_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown stats field(s) {', '.join(unknown)}; allowed: {', '.join(STATS_FIELDS)}",
+        )
     try:
-        base_url_=f"https://qa6-red-api.sprinklr.com/internal-cross/api/v1/getDirectESStats?queryField=clusterName&host={cluster_name}&call=_stats%2Findexing%2Csearch%2Crefresh%2Cdocs%2Cstore%3Flevel%3Dindices%26filter_path%3Dindices.*.primaries.indexing.index_total%2Cindices.*.primaries.search.query_total%2Cindices.*.primaries.refresh.total%2Cindices.*.primaries.docs.count%2Cindices.*.primaries.store.size_in_bytes%2Cindices.*.health"
+        fields = [field for field in STATS_FIELDS if field in fields or field == sort_by]
+        params = {
+            "queryField": "clusterName",
+            "host": cluster_name,
+            "call": build_stats_call(fields),
+        }
+        url = "https://qa6-red-api.sprinklr.com/internal-cross/api/v1/getDirectESStats"
+        # min-heap keyed on (value, -arrival) keeps the first-seen index on ties, like a stable sort
+        top = []
+        results = []
+        seq = 0
         async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(base_url_, headers=headers_red)
-            response.raise_for_status()
-            stats_data = response.json()
-            indices_data = stats_data.get("indices", {})
-
-            results = []
-            for index_name, data in indices_data.items():   
-                health_st= data.get("health", "unknown")
-                primaries = data.get("primaries", {})
-                entry = {
-                    "index": index_name,
-                    "docs_count": primaries.get("docs", {}).get("count", 0),
-                    "store_size": primaries.get("store", {}).get("size_in_bytes", 0),
-                    "indexing_index_total": primaries.get("indexing", {}).get("index_total", 0),
-                    "search_query_total": primaries.get("search", {}).get("query_total", 0),
-                    "refresh_refresh_total": primaries.get("refresh", {}).get("total", 0),
-                    "health": health_st
-                }
-                results.append(entry)
-            sorted_results = sorted(results, key=lambda x: x.get(sort_by, 0), reverse=True)
-            if top_n == 0:
-                return sorted_results
-            return sorted_results[:top_n]
+            async with client.stream("GET", url, params=params, headers=headers_red) as response:
+                response.raise_for_status()
+                async for entry in stream_index_stats(response, fields):
+                    if top_n == 0:
+                        results.append(entry)
+                        continue
+                    item = (entry[sort_by], -seq, entry)
+                    seq += 1
+                    if len(top) < top_n:
+                        heapq.heappush(top, item)
+                    elif item[:2] > top[0][:2]:
+                        heapq.heapreplace(top, item)
+        if top_n == 0:
+            return sorted(results, key=lambda x: x.get(sort_by, 0), reverse=True)
+        return [entry for _, _, entry in sorted(top, key=lambda item: item[:2], reverse=True)]
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=str(e))
     except Exception as e:
@@ -187,6 +310,213 @@ async def get_all_nodes(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+CAT_COLUMNS = {
+    "shards": ["index", "shard", "prirep", "state", "docs", "store", "node", "unassigned.reason"],
+    "indices": ["index", "health", "status", "pri", "rep", "docs.count", "store.size", "pri.store.size"],
+    "nodes": ["name", "ip", "node.role", "disk.total", "disk.used", "disk.avail", "disk.used_percent", "heap.percent"],
+}
+CAT_NUMERIC_COLUMNS = {
+    "shard", "docs", "store", "pri", "rep", "docs.count", "store.size", "pri.store.size",
+    "disk.total", "disk.used", "disk.avail", "disk.used_percent", "heap.percent",
+}
+CAT_FLOAT_COLUMNS = {"disk.used_percent"}
+
+
+def cat_rows_to_frame(rows: List[Dict[str, Any]], columns: List[str]) -> pd.DataFrame:
+    # _cat with format=json returns every value as a string; bytes=b keeps sizes as plain integers
+    frame = pd.DataFrame.from_records(rows, columns=columns)
+    for col in columns:
+        if col in CAT_NUMERIC_COLUMNS:
+            dtype = "float64" if col in CAT_FLOAT_COLUMNS else "Int64"
+            frame[col] = pd.to_numeric(frame[col], errors="coerce").astype(dtype)
+    if "node" in frame:
+        # a RELOCATING shard is reported as "src -> <ip> <id> dst"; count it against its source node
+        node = frame["node"]
+        frame["node"] = node.where(node.isna(), node.astype(str).str.split(" -> ").str[0])
+    return frame
+
+
+def frame_to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN is not valid JSON, so missing values go out as null
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+async def fetch_cat_frame(cluster_name: str, cat_api: str, target: str = "") -> pd.DataFrame:
+    columns = CAT_COLUMNS[cat_api]
+    path = f"_cat/{cat_api}/{target}" if target else f"_cat/{cat_api}"
+    params = {
+        "queryField": "clusterName",
+        "host": cluster_name,
+        "call": f"{path}?format=json&bytes=b&h={','.join(columns)}",
+    }
+    url = "https://qa6-red-api.sprinklr.com/internal-cross/api/v1/getDirectESStats"
+    async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
+        response = await client.get(url, params=params, headers=headers_red)
+        response.raise_for_status()
+        return cat_rows_to_frame(response.json(), columns)
+
+
+def shard_size_skew(shards: pd.DataFrame) -> Dict[str, Any]:
+    started = shards[shards["state"].isin(["STARTED", "RELOCATING"])]
+    per_node = started.groupby("node")["store"].agg(
+        shards="size", total_bytes="sum", mean_shard_bytes="mean", max_shard_bytes="max"
+    )
+    if per_node.empty:
+        return {"coefficient_of_variation": 0.0, "max_skew": 0.0, "nodes": []}
+    node_mean = per_node["total_bytes"].mean()
+    per_node["skew"] = per_node["total_bytes"] / node_mean if node_mean > 0 else 0.0
+    per_node = per_node.sort_values("skew", ascending=False).reset_index()
+    return {
+        "coefficient_of_variation": float(per_node["total_bytes"].std(ddof=0) / node_mean) if node_mean > 0 else 0.0,
+        "max_skew": float(per_node["skew"].iloc[0]),
+        "nodes": frame_to_records(per_node),
+    }
+
+
+def shard_size_outliers(shards: pd.DataFrame, indices: pd.DataFrame, min_bytes: float, max_bytes: float, limit: int) -> Dict[str, Any]:
+    primaries = shards[shards["prirep"].eq("p") & shards["state"].eq("STARTED")]
+    oversized = primaries[primaries["store"] > max_bytes]
+    undersized = primaries[primaries["store"] < min_bytes]
+
+    index_avg = indices[["index", "pri", "pri.store.size"]].copy()
+    index_avg["avg_primary_shard_bytes"] = index_avg["pri.store.size"] / index_avg["pri"].replace(0, np.nan)
+    avg = index_avg["avg_primary_shard_bytes"]
+    shard_cols = ["index", "shard", "node", "docs", "store"]
+    return {
+        "min_shard_bytes": min_bytes,
+        "max_shard_bytes": max_bytes,
+        "oversized_count": int(len(oversized)),
+        "undersized_count": int(len(undersized)),
+        "oversized": frame_to_records(oversized.nlargest(limit, "store")[shard_cols]),
+        "undersized": frame_to_records(undersized.nsmallest(limit, "store")[shard_cols]),
+        "oversharded_indices": frame_to_records(index_avg[(avg < min_bytes) & (index_avg["pri"] > 1)].nsmallest(limit, "avg_primary_shard_bytes")),
+        "undersharded_indices": frame_to_records(index_avg[avg > max_bytes].nlargest(limit, "avg_primary_shard_bytes")),
+    }
+
+
+def unassigned_shard_breakdown(shards: pd.DataFrame, limit: int) -> Dict[str, Any]:
+    unassigned = shards[shards["state"].eq("UNASSIGNED")]
+    return {
+        "total": int(len(unassigned)),
+        "by_reason": unassigned["unassigned.reason"].fillna("UNKNOWN").value_counts().to_dict(),
+        "by_type": unassigned["prirep"].map({"p": "primary", "r": "replica"}).value_counts().to_dict(),
+        "by_index": unassigned.groupby("index").size().nlargest(limit).to_dict(),
+    }
+
+
+def node_disk_pressure(nodes: pd.DataFrame, shards: pd.DataFrame, low: float, high: float, flood: float) -> List[Dict[str, Any]]:
+    per_node = shards.groupby("node")["store"].agg(shards="size", shard_bytes="sum")
+    frame = nodes.merge(per_node, how="left", left_on="name", right_index=True)
+    frame["shards"] = frame["shards"].fillna(0).astype(int)
+    frame["shard_bytes"] = frame["shard_bytes"].fillna(0)
+    used = frame["disk.used_percent"]
+    frame["watermark"] = np.select(
+        [used.isna(), used >= flood, used >= high, used >= low],
+        ["unknown", "flood_stage", "high", "low"],
+        default="ok",
+    )
+    frame = frame.sort_values("disk.used_percent", ascending=False, na_position="last")
+    return frame_to_records(frame)
+
+
+def summarize_shards(shards: pd.DataFrame, limit: int = 5) -> Dict[str, Any]:
+    skew = shard_size_skew(shards)
+    skew["nodes"] = skew["nodes"][:limit]
+    return {
+        "total_shards": int(len(shards)),
+        "by_state": shards["state"].value_counts().to_dict(),
+        "total_store_bytes": int(shards["store"].sum()),
+        "size_skew": skew,
+        "shards_per_node": shards.groupby("node").size().nlargest(limit).to_dict(),
+        "unassigned": unassigned_shard_breakdown(shards, limit),
+        "unassigned_shards": frame_to_records(
+            shards[shards["state"].eq("UNASSIGNED")].head(limit)[["index", "shard", "prirep", "unassigned.reason"]]
+        ),
+        "largest_shards": frame_to_records(shards.nlargest(limit, "store")[["index", "shard", "prirep", "node", "store"]]),
+    }
+
+
+def cat_shards_target(endpoint: str) -> str:
+    # "_cat/shards/<index>" or "_cat/shards?index=<index>"; empty for the whole cluster
+    parts = urlsplit(endpoint.strip().lstrip("/"))
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if len(segments) > 2:
+        return segments[2]
+    return ",".join(parse_qs(parts.query).get("index", []))
+
+
+@router.get("/cat/shard-skew")
+async def get_shard_skew(
+    cluster_name: str = Query(default="", description="Name of the Elasticsearch cluster")
+):
+    try:
+        shards = await fetch_cat_frame(cluster_name, "shards")
+        return shard_size_skew(shards)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+
+@router.get("/cat/shard-sizing")
+async def get_shard_sizing(
+    cluster_name: str = Query(default="", description="Name of the Elasticsearch cluster"),
+    min_shard_gb: float = Query(default=1.0, ge=0),
+    max_shard_gb: float = Query(default=50.0, gt=0),
+    top_n: int = Query(default=20, gt=0),
+):
+    if min_shard_gb >= max_shard_gb:
+        raise HTTPException(status_code=422, detail="min_shard_gb must be lower than max_shard_gb")
+    try:
+        shards, indices = await asyncio.gather(
+            fetch_cat_frame(cluster_name, "shards"),
+            fetch_cat_frame(cluster_name, "indices"),
+        )
+        return shard_size_outliers(shards, indices, min_shard_gb * 1024 ** 3, max_shard_gb * 1024 ** 3, top_n)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+
+@router.get("/cat/unassigned-shards")
+async def get_unassigned_shards(
+    cluster_name: str = Query(default="", description="Name of the Elasticsearch cluster"),
+    top_n: int = Query(default=20, gt=0),
+):
+    try:
+        shards = await fetch_cat_frame(cluster_name, "shards")
+        return unassigned_shard_breakdown(shards, top_n)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+
+@router.get("/cat/disk-pressure")
+async def get_disk_pressure(
+    cluster_name: str = Query(default="", description="Name of the Elasticsearch cluster"),
+    low_watermark: float = Query(default=85.0, ge=0, le=100),
+    high_watermark: float = Query(default=90.0, ge=0, le=100),
+    flood_watermark: float = Query(default=95.0, ge=0, le=100),
+):
+    if not low_watermark <= high_watermark <= flood_watermark:
+        raise HTTPException(
+            status_code=422,
+            detail="Watermarks must satisfy low_watermark <= high_watermark <= flood_watermark",
+        )
+    try:
+        nodes, shards = await asyncio.gather(
+            fetch_cat_frame(cluster_name, "nodes"),
+            fetch_cat_frame(cluster_name, "shards"),
+        )
+        return node_disk_pressure(nodes, shards, low_watermark, high_watermark, flood_watermark)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+
 def genPayload(prompt):
     payload_d  = {
             "partnerId": 99999989,
@@ -621,15 +951,24 @@ async def send_chat_message(msg: ChatMessageTool):
                 assistant_reply=response.json().get("response", "").get("choices", "")[0].get("message", "").get("content", "No content found")
                 shared_context_tool.add_assistant_message(assistant_reply)
                 tool_response=1
+                summarised=False
                 try:
                     # print(111)
-                    tool_response = await fetch_cluster_data(assistant_reply,cluster_name=msg.cluster_name)
+                    if assistant_reply.strip().lstrip("/").startswith("_cat/shards"):
+                        # summarise every shard instead of sending the first 5000 characters of the table
+                        target = cat_shards_target(assistant_reply)
+                        shards = await fetch_cat_frame(msg.cluster_name, "shards", target)
+                        tool_response = json.dumps({"index": target or "_all", "summary": summarize_shards(shards)})
+                        summarised = True
+                    else:
+                        tool_response = await fetch_cluster_data(assistant_reply,cluster_name=msg.cluster_name)
                 except:
                     # print(222)
                     tool_response=False
                 if(not tool_response):
                     return {"reply":"Can't extact data, please provide your data"}
-                shared_context_tool.add_tool_response(assistant_reply,str(tool_response)[:5000])
+                # the shard summary is already bounded, and cutting it would leave invalid JSON
+                shared_context_tool.add_tool_response(assistant_reply,tool_response if summarised else str(tool_response)[:5000])
                 shared_context_tool.add_user_message("Answer this user query using the above Elasticsearch Api response output : "+msg.message)
                 payload = gen_chatbot_Payload(shared_context_tool.get_trimmed_history(model="gpt-4o-mini"))
                 # print(1111)